@@ -880,6 +880,15 @@ class ImageDownloaderApp(ctk.CTk):
             max_workers=self.max_downloads,
             folder_structure=self.settings.get('folder_structure', 'default'),
             stream_read_timeout=self.request_timeout,
+            stream_posts=bool(self.settings.get('stream_post_listing', True)),
+            page_concurrency=self.settings.get('page_concurrency', 3),
+            segmented_downloads=bool(self.settings.get('segmented_downloads', False)),
+            segment_count=self.settings.get('segment_count', 4),
+            segment_threshold=int(self.settings.get('segment_threshold_mb', 64)) * 1024 * 1024,
+            rate_limit_interval=self.settings.get('rate_limit_interval', 1.0),
+            host_limits=self.settings.get('host_limits'),
+            adaptive_concurrency=bool(self.settings.get('adaptive_concurrency', False)),
+            subdomain_cache_ttl=float(self.settings.get('subdomain_cache_ttl_hours', 24)) * 60 * 60,
         ))
         self.general_downloader.file_naming_mode = self.settings.get('file_naming_mode', 0)
 
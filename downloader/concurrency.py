@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of concurrent transfers on one host.
+
+    The limit grows by one per evaluation window while the host is saturated,
+    throughput keeps growing and time-to-first-byte stays close to the best
+    value seen. A 429/503 or Retry-After cuts it multiplicatively and holds
+    it there for a cooldown period.
+    """
+
+    def __init__(self, connection_limit, min_limit=1, max_limit=8, window=5.0, backoff=0.5,
+                 latency_tolerance=1.5, growth_threshold=1.05, on_change=None):
+        self._lock = threading.Lock()
+        self.connection_limit = connection_limit
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.window = window
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.growth_threshold = growth_threshold
+        self.on_change = on_change
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_ttfb = []
+        self._last_throughput = 0.0
+        self._baseline_ttfb = None
+        self._cooldown_until = 0.0
+        self.connection_limit.set_limit(max(self.min_limit, self.max_limit // 2))
+
+    @property
+    def limit(self):
+        return self.connection_limit.limit
+
+    def set_max_limit(self, max_limit):
+        with self._lock:
+            self.max_limit = max(self.min_limit, int(max_limit))
+            if self.limit > self.max_limit:
+                self._apply(self.max_limit)
+
+    def record_bytes(self, count):
+        with self._lock:
+            self._window_bytes += count
+            self._maybe_evaluate()
+
+    def record_response(self, status_code, ttfb, retry_after=None):
+        if status_code in (429, 503) or retry_after:
+            self.record_throttle(retry_after)
+            return
+        with self._lock:
+            if status_code and status_code < 400:
+                self._window_ttfb.append(ttfb)
+            self._maybe_evaluate()
+
+    def record_throttle(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                return
+            self._cooldown_until = now + max(self.window, retry_after or 0)
+            self._apply(max(self.min_limit, int(self.limit * self.backoff)))
+            self._reset_window(now)
+            self._last_throughput = 0.0
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_ttfb = []
+
+    def _maybe_evaluate(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+
+        throughput = self._window_bytes / elapsed
+        ttfb = sum(self._window_ttfb) / len(self._window_ttfb) if self._window_ttfb else None
+        saturated = self.connection_limit.active >= self.limit
+        self._reset_window(now)
+
+        if ttfb is not None:
+            if self._baseline_ttfb is None or ttfb < self._baseline_ttfb:
+                self._baseline_ttfb = ttfb
+        latency_flat = ttfb is None or self._baseline_ttfb is None or \
+            ttfb <= self._baseline_ttfb * self.latency_tolerance
+        growing = throughput >= self._last_throughput * self.growth_threshold
+        if throughput > 0:
+            self._last_throughput = throughput
+
+        if now < self._cooldown_until or not saturated:
+            return
+        if growing and latency_flat and self.limit < self.max_limit:
+            self._apply(self.limit + 1)
+
+    def _apply(self, new_limit):
+        if new_limit == self.limit:
+            return
+        self.connection_limit.set_limit(new_limit)
+        if self.on_change:
+            self.on_change(new_limit)
@@ -0,0 +1,101 @@
+import queue
+import sqlite3
+import threading
+import time
+
+
+class DatabaseWriter:
+    """Single writer thread for the downloads database.
+
+    Statements are queued and committed together every ``commit_interval``
+    seconds or ``max_batch`` statements, whichever comes first, on a WAL
+    connection owned by the thread. The thread exits after ``idle_timeout``
+    seconds without work and is restarted by the next write.
+    """
+
+    def __init__(self, db_path, commit_interval=0.2, max_batch=500, idle_timeout=5.0, on_error=None):
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.idle_timeout = idle_timeout
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def execute(self, sql, params=()):
+        self._put((sql, params, False))
+
+    def executemany(self, sql, seq_of_params):
+        self._put((sql, list(seq_of_params), True))
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._put(done)
+        return done.wait(timeout)
+
+    def _put(self, item):
+        with self._lock:
+            self._queue.put(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _report(self, error):
+        if self.on_error:
+            self.on_error(error)
+
+    def _run(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    with self._lock:
+                        if self._queue.empty():
+                            self._thread = None
+                            return
+                    continue
+
+                batch = [item]
+                deadline = time.monotonic() + self.commit_interval
+                while len(batch) < self.max_batch and not isinstance(item, threading.Event):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+                self._write(connection, batch)
+        except Exception as e:
+            with self._lock:
+                self._thread = None
+            self._report(e)
+        finally:
+            connection.close()
+
+    def _write(self, connection, batch):
+        waiters = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                continue
+            sql, params, many = item
+            try:
+                if many:
+                    connection.executemany(sql, params)
+                else:
+                    connection.execute(sql, params)
+            except sqlite3.Error as e:
+                self._report(e)
+        try:
+            connection.commit()
+        except sqlite3.Error as e:
+            self._report(e)
+        for waiter in waiters:
+            waiter.set()
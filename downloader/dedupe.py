@@ -0,0 +1,58 @@
+import os
+import re
+import shutil
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CONTENT_HASH_PATTERN = re.compile(r'/([0-9a-fA-F]{64})\.[^/.]+$')
+
+# ioctl(dest_fd, FICLONE, src_fd) shares extents on btrfs/xfs/bcachefs.
+FICLONE = 0x40049409
+
+DUPLICATE_MODES = ('hardlink', 'reflink', 'copy', 'skip')
+
+
+def content_hash_from_url(media_url):
+    """sha256 embedded in coomer/kemono paths like /data/ab/cd/<sha256>.<ext>."""
+    match = CONTENT_HASH_PATTERN.search(urlparse(media_url).path)
+    return match.group(1).lower() if match else None
+
+
+def _reflink(source_path, target_path):
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(target_path)
+            raise
+
+
+def place_duplicate(source_path, target_path, mode='hardlink'):
+    """Materialise ``source_path`` at ``target_path`` without downloading it.
+
+    ``hardlink`` falls back to a reflink and then a copy, ``reflink`` falls
+    back to a copy. Returns the method that worked.
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    if mode == 'hardlink':
+        try:
+            os.link(source_path, target_path)
+            return 'hardlink'
+        except OSError:
+            pass
+    if mode in ('hardlink', 'reflink'):
+        try:
+            _reflink(source_path, target_path)
+            return 'reflink'
+        except OSError:
+            pass
+    shutil.copy2(source_path, target_path)
+    return 'copy'
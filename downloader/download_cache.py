@@ -0,0 +1,148 @@
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import threading
+
+
+class BloomFilter:
+    _HEADER = struct.Struct("<8sQIQq")
+    _MAGIC = b"CDLBLOOM"
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, int(capacity))
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def save(self, path, max_id):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._HEADER.pack(self._MAGIC, self.size, self.hashes, self.capacity, max_id))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Returns ``(filter, max_id)`` or ``(None, None)`` if the file is missing or unreadable."""
+        try:
+            with open(path, "rb") as f:
+                magic, size, hashes, capacity, max_id = cls._HEADER.unpack(f.read(cls._HEADER.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None, None
+        if magic != cls._MAGIC or len(bits) != (size + 7) // 8:
+            return None, None
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.size = size
+        bloom.hashes = hashes
+        bloom.bits = bits
+        return bloom, max_id
+
+
+class DownloadCache:
+    """``media_url in cache`` answered by a Bloom filter over the downloads
+    table, confirmed with an indexed point lookup. The filter is built on
+    first use, persisted next to the database and caught up incrementally
+    from rows with a higher id on the next run."""
+
+    def __init__(self, db_path, filter_path, error_rate=0.01):
+        self.db_path = db_path
+        self.filter_path = filter_path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._connection = None
+        self._filter = None
+        self._max_id = 0
+        self._recent = {}
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        return self._connection
+
+    def _ensure_filter(self):
+        if self._filter is not None:
+            return self._filter
+        connection = self._get_connection()
+        # Ids only grow, so MAX(id) bounds the row count without a table scan.
+        max_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM downloads").fetchone()[0]
+
+        bloom, stored_max_id = BloomFilter.load(self.filter_path)
+        if bloom is None or stored_max_id > max_id or max_id > bloom.capacity:
+            bloom = BloomFilter(max(max_id * 2, 100000), self.error_rate)
+            stored_max_id = 0
+
+        cursor = connection.execute("SELECT media_url FROM downloads WHERE id > ?", (stored_max_id,))
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for (media_url,) in rows:
+                bloom.add(media_url)
+        self._max_id = max_id
+        self._filter = bloom
+        return bloom
+
+    def __contains__(self, media_url):
+        with self._lock:
+            if media_url in self._recent:
+                return True
+            if media_url not in self._ensure_filter():
+                return False
+            row = self._get_connection().execute(
+                "SELECT 1 FROM downloads WHERE media_url = ? LIMIT 1", (media_url,)).fetchone()
+            return row is not None
+
+    def __setitem__(self, media_url, value):
+        with self._lock:
+            self._recent[media_url] = value
+            self._ensure_filter().add(media_url)
+
+    def get(self, media_url, default=None):
+        with self._lock:
+            if media_url in self._recent:
+                return self._recent[media_url]
+            row = self._get_connection().execute(
+                "SELECT file_path, file_size FROM downloads WHERE media_url = ?", (media_url,)).fetchone()
+        return tuple(row) if row else default
+
+    def save(self):
+        with self._lock:
+            if self._filter is None:
+                return
+            connection = self._get_connection()
+            max_id = self._max_id
+            for row_id, media_url in connection.execute(
+                    "SELECT id, media_url FROM downloads WHERE id > ?", (self._max_id,)):
+                self._filter.add(media_url)
+                max_id = max(max_id, row_id)
+            self._max_id = max_id
+            try:
+                self._filter.save(self.filter_path, max_id)
+            except OSError:
+                pass
+
+    def close(self):
+        self.save()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -1,7 +1,7 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Semaphore
 from urllib.parse import quote_plus, urlencode, urljoin, urlparse
+import json
 import os
 import re
 import requests
@@ -9,6 +9,11 @@ import threading
 import time
 import sqlite3
 
+from downloader.db_writer import DatabaseWriter
+from downloader.dedupe import DUPLICATE_MODES, content_hash_from_url, place_duplicate
+from downloader.download_cache import DownloadCache
+from downloader.rate_limiter import HostRateLimiter, parse_retry_after
+
 class Downloader:
 	def __init__(self, download_folder, max_workers=5, log_callback=None,
 				 enable_widgets_callback=None, update_progress_callback=None,
@@ -16,7 +21,10 @@ class Downloader:
 				 max_retries=5, retry_interval=1.0, stream_read_timeout=20,
 				 download_images=True, download_videos=True, download_compressed=True,
 				 tr=None, folder_structure='default', rate_limit_interval=1.0,
-				 config_dir=None):
+				 config_dir=None, stream_posts=True, page_concurrency=3,
+				 segmented_downloads=False, segment_count=4, segment_threshold=64 * 1024 * 1024,
+				 host_limits=None, adaptive_concurrency=False, subdomain_cache_ttl=24 * 60 * 60,
+				 subdomain_probe_concurrency=10, duplicate_handling='hardlink'):
 		
 		self.download_folder = download_folder
 		self.log_callback = log_callback
@@ -39,11 +47,17 @@ class Downloader:
 		self._sessions = set()
 		self.max_workers = max_workers
 		self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-		self.rate_limit = Semaphore(self.max_workers)  
-		self.domain_locks = defaultdict(lambda: Semaphore(self.max_workers))
-		self.domain_last_request = defaultdict(float)  
+		self.adaptive_concurrency = adaptive_concurrency
+		self.host_limiter = HostRateLimiter(max_connections=self.max_workers, host_limits=host_limits,
+											adaptive=adaptive_concurrency,
+											on_limit_change=self._on_host_limit_change)
 		self.rate_limit_interval = rate_limit_interval
 		self.download_mode = "multi"  
+		self.stream_posts = stream_posts
+		try:
+			self.page_concurrency = max(1, int(page_concurrency))
+		except (TypeError, ValueError):
+			self.page_concurrency = 3
 		self.video_extensions = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.wmv', '.m4v')
 		self.image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff')
 		self.document_extensions = ('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx')
@@ -51,6 +65,11 @@ class Downloader:
 		self.download_images = download_images
 		self.download_videos = download_videos
 		self.download_compressed = download_compressed
+		self.segmented_downloads = segmented_downloads
+		self.segmented_extensions = self.video_extensions + self.compressed_extensions
+		self.segment_count = max(1, int(segment_count))
+		self.segment_threshold = max(1, int(segment_threshold))
+		self.min_segment_size = 4 * 1024 * 1024
 		self.futures = []
 		self.futures_lock = threading.Lock()
 		self.total_files = 0
@@ -66,8 +85,13 @@ class Downloader:
 		self.retry_interval = retry_interval
 		self.file_lock = threading.Lock()
 		self.post_attachment_counter = defaultdict(int)
+		self.duplicate_handling = duplicate_handling if duplicate_handling in DUPLICATE_MODES else 'hardlink'
+		self.content_hash_paths = {}
 		self.subdomain_cache = {}
 		self.subdomain_locks = defaultdict(threading.Lock)
+		self.subdomain_cache_ttl = subdomain_cache_ttl
+		self.subdomain_probe_concurrency = max(1, int(subdomain_probe_concurrency))
+		self._probe_executor = None
 		try:
 			self.stream_read_timeout = float(stream_read_timeout)
 		except (TypeError, ValueError):
@@ -81,9 +105,25 @@ class Downloader:
 		os.makedirs(self.config_dir, exist_ok=True)
 		self.db_path = os.path.join(self.config_dir, "downloads.db")
 		self.db_lock = threading.Lock()  
+		self.db_writer = DatabaseWriter(self.db_path, on_error=lambda e: self.log(f"Database write failed: {e}"))
 		self.init_db()
 		self.load_download_cache()
 		self.load_partial_downloads()
+		self.load_subdomain_nodes()
+
+	@property
+	def rate_limit_interval(self):
+		return self._rate_limit_interval
+
+	@rate_limit_interval.setter
+	def rate_limit_interval(self, interval):
+		try:
+			interval = float(interval)
+		except (TypeError, ValueError):
+			interval = 1.0
+		self._rate_limit_interval = max(0.0, interval)
+		self.host_limiter.set_defaults(
+			requests_per_second=1.0 / self._rate_limit_interval if self._rate_limit_interval > 0 else 0)
 
 	def _create_session(self):
 		session = requests.Session()
@@ -109,8 +149,9 @@ class Downloader:
 				pass
 
 	def init_db(self):
-		self.db_connection = sqlite3.connect(self.db_path, check_same_thread=False)
+		self.db_connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
 		self.db_cursor = self.db_connection.cursor()
+		self.db_cursor.execute("PRAGMA journal_mode=WAL")
 		self.db_cursor.execute("""
 			CREATE TABLE IF NOT EXISTS downloads (
 				id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -122,6 +163,12 @@ class Downloader:
 				downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 			)
 		""")
+		self.db_cursor.execute("PRAGMA table_info(downloads)")
+		download_columns = {row[1] for row in self.db_cursor.fetchall()}
+		if "content_hash" not in download_columns:
+			self.db_cursor.execute("ALTER TABLE downloads ADD COLUMN content_hash TEXT")
+			self._backfill_content_hashes()
+		self.db_cursor.execute("CREATE INDEX IF NOT EXISTS idx_downloads_content_hash ON downloads(content_hash)")
 		self.db_cursor.execute("""
 							   CREATE TABLE IF NOT EXISTS partial_downloads
 							   (
@@ -134,60 +181,93 @@ class Downloader:
 								   updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 							   )
 							   """)
+		self.db_cursor.execute("PRAGMA table_info(partial_downloads)")
+		partial_columns = {row[1] for row in self.db_cursor.fetchall()}
+		if "segments" not in partial_columns:
+			self.db_cursor.execute("ALTER TABLE partial_downloads ADD COLUMN segments TEXT")
+		self.db_cursor.execute("""
+			CREATE TABLE IF NOT EXISTS subdomain_nodes (
+				prefix TEXT PRIMARY KEY,
+				node TEXT,
+				updated_at REAL
+			)
+		""")
 		self.db_connection.commit()
 
+	def _backfill_content_hashes(self, batch_size=10000):
+		last_id = 0
+		while True:
+			self.db_cursor.execute("SELECT id, media_url FROM downloads WHERE id > ? ORDER BY id LIMIT ?",
+								   (last_id, batch_size))
+			rows = self.db_cursor.fetchall()
+			if not rows:
+				break
+			last_id = rows[-1][0]
+			updates = [(content_hash_from_url(media_url), row_id) for row_id, media_url in rows
+					   if media_url and content_hash_from_url(media_url)]
+			self.db_cursor.executemany("UPDATE downloads SET content_hash = ? WHERE id = ?", updates)
+
 	def load_download_cache(self):
+		self.download_cache = DownloadCache(self.db_path, os.path.join(self.config_dir, "downloads.bloom"))
+
+	def load_subdomain_nodes(self):
+		cutoff = time.time() - self.subdomain_cache_ttl
 		with self.db_lock:
-			self.db_cursor.execute("SELECT media_url, file_path, file_size FROM downloads")
+			self.db_cursor.execute("SELECT prefix, node, updated_at FROM subdomain_nodes WHERE updated_at >= ?",
+								   (cutoff,))
 			rows = self.db_cursor.fetchall()
-		self.download_cache = {row[0]: (row[1], row[2]) for row in rows}
+		self.subdomain_cache = {row[0]: (row[1], row[2]) for row in rows}
+		self.db_writer.execute("DELETE FROM subdomain_nodes WHERE updated_at < ?", (cutoff,))
 
 	def load_partial_downloads(self):
 		with self.db_lock:
 			self.db_cursor.execute(
-				"SELECT media_url, tmp_path, downloaded_size, total_size, user_id, post_id FROM partial_downloads")
+				"SELECT media_url, tmp_path, downloaded_size, total_size, user_id, post_id, segments FROM partial_downloads")
 			rows = self.db_cursor.fetchall()
 
 		self.partial_downloads = {}
 		stale_entries = []
-		for media_url, tmp_path, downloaded_size, total_size, user_id, post_id in rows:
+		for media_url, tmp_path, downloaded_size, total_size, user_id, post_id, segments in rows:
 			if tmp_path and os.path.exists(tmp_path):
+				try:
+					segments = json.loads(segments) if segments else None
+				except ValueError:
+					segments = None
 				self.partial_downloads[media_url] = {
 					"tmp_path": tmp_path,
 					"downloaded_size": downloaded_size or 0,
 					"total_size": total_size or 0,
 					"user_id": user_id,
 					"post_id": post_id,
+					"segments": segments,
 				}
 			else:
 				stale_entries.append(media_url)
 
 		if stale_entries:
-			with self.db_lock:
-				self.db_cursor.executemany("DELETE FROM partial_downloads WHERE media_url = ?",
-										   [(url,) for url in stale_entries])
-				self.db_connection.commit()
+			self.db_writer.executemany("DELETE FROM partial_downloads WHERE media_url = ?",
+									   [(url,) for url in stale_entries])
 
-	def update_partial_download(self, media_url, tmp_path, downloaded_size, total_size, user_id, post_id):
+	def update_partial_download(self, media_url, tmp_path, downloaded_size, total_size, user_id, post_id, segments=None):
 		if not media_url or not tmp_path:
 			return
 
 		stored_total_size = total_size if total_size else None
-		with self.db_lock:
-			self.db_cursor.execute("""
-								   INSERT INTO partial_downloads (media_url, tmp_path, downloaded_size, total_size,
-																  user_id, post_id, updated_at)
-								   VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-								   ON CONFLICT(media_url) DO UPDATE SET tmp_path        = excluded.tmp_path,
-																		downloaded_size = excluded.downloaded_size,
-																		total_size      = excluded.total_size,
-																		user_id         = excluded.user_id,
-																		post_id         = excluded.post_id,
-																		updated_at      = CURRENT_TIMESTAMP
-								   """,
-								   (media_url, tmp_path, downloaded_size, stored_total_size, user_id, post_id)
-								   )
-		self.db_connection.commit()
+		stored_segments = json.dumps(segments) if segments else None
+		self.db_writer.execute("""
+			INSERT INTO partial_downloads (media_url, tmp_path, downloaded_size, total_size,
+										   user_id, post_id, segments, updated_at)
+			VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+			ON CONFLICT(media_url) DO UPDATE SET tmp_path        = excluded.tmp_path,
+												 downloaded_size = excluded.downloaded_size,
+												 total_size      = excluded.total_size,
+												 user_id         = excluded.user_id,
+												 post_id         = excluded.post_id,
+												 segments        = excluded.segments,
+												 updated_at      = CURRENT_TIMESTAMP
+			""",
+			(media_url, tmp_path, downloaded_size, stored_total_size, user_id, post_id, stored_segments)
+		)
 
 		self.partial_downloads[media_url] = {
 			"tmp_path": tmp_path,
@@ -195,14 +275,13 @@ class Downloader:
 			"total_size": total_size or 0,
 			"user_id": user_id,
 			"post_id": post_id,
+			"segments": segments,
 		}
 
 	def remove_partial_download(self, media_url):
 		if not media_url:
 			return
-		with self.db_lock:
-			self.db_cursor.execute("DELETE FROM partial_downloads WHERE media_url = ?", (media_url,))
-			self.db_connection.commit()
+		self.db_writer.execute("DELETE FROM partial_downloads WHERE media_url = ?", (media_url,))
 		self.partial_downloads.pop(media_url, None)
 
 	def log(self, message):
@@ -255,12 +334,7 @@ class Downloader:
 
 		
 		self.executor = ThreadPoolExecutor(max_workers=max_workers)
-		self.rate_limit = Semaphore(max_workers)
-
-		existing_domains = list(self.domain_locks.keys())
-		self.domain_locks = defaultdict(lambda: Semaphore(max_workers))
-		for domain in existing_domains:
-			self.domain_locks[domain] = Semaphore(max_workers)
+		self.host_limiter.set_defaults(max_connections=max_workers)
 
 		self.log(
 			self.tr("Updated download mode to {mode} with max_workers = {max_workers}").format(mode=mode,
@@ -336,8 +410,14 @@ class Downloader:
 				self._is_paused = False
 			if self.executor:
 				self.executor.shutdown(wait=True)
+			if self._probe_executor:
+				self._probe_executor.shutdown(wait=False, cancel_futures=True)
+				self._probe_executor = None
 			self._close_sessions()
 			self._reset_futures()
+			self.db_writer.flush()
+			if isinstance(self.download_cache, DownloadCache):
+				self.download_cache.close()
 			if self.enable_widgets_callback:
 				self.enable_widgets_callback()
 			self.log(self.tr("All downloads completed or cancelled."))
@@ -351,15 +431,30 @@ class Downloader:
 		)
 		self.log(message)
 
+	def _on_host_limit_change(self, host, limit):
+		self.log(f"Adaptive concurrency for {host}: {limit} simultaneous downloads")
+
+	def _limited_get(self, session, url, headers=None, stream=False):
+		limiter = self.host_limiter.for_host(urlparse(url).netloc)
+		if not limiter.wait_for_start(self.cancel_requested):
+			return None
+		with limiter.connection():
+			started = time.monotonic()
+			response = session.get(url, stream=stream, headers=headers, timeout=self.stream_read_timeout)
+		response_headers = getattr(response, 'headers', None) or {}
+		limiter.record_response(getattr(response, 'status_code', None), time.monotonic() - started,
+								parse_retry_after(response_headers.get('Retry-After')))
+		return response
+
 	def safe_request(self, url, max_retries=None, headers=None):
 		if max_retries is None:
 			max_retries = self.max_retries
 		if headers is None:
 			headers = self.headers
 
+		url = self._cached_node_url(url) or url
 		parsed = urlparse(url)
 		domain = parsed.netloc
-		path = parsed.path
 		session = self._get_session()
 
 		for attempt in range(max_retries + 1):
@@ -369,108 +464,171 @@ class Downloader:
 			if not self.wait_if_paused():
 				return None
 
-			with self.domain_locks[domain]:
-				elapsed_time = time.time() - self.domain_last_request[domain]
-				if elapsed_time < self.rate_limit_interval:
-					time.sleep(self.rate_limit_interval - elapsed_time)
-
-				try:
-					self.domain_last_request[domain] = time.time()
-					
-					response = session.get(url, stream=True, headers=headers, timeout=self.stream_read_timeout)
-					sc = response.status_code
+			retry_delay = 0
+			try:
+				response = self._limited_get(session, url, headers=headers, stream=True)
+				if response is None:
+					return None
+				sc = response.status_code
 
-					if sc in (403, 404) and ("coomer" in domain or "kemono" in domain):
-						if self.update_progress_callback:
-							self.update_progress_callback(0, 0, status=f"{sc} - probing subdomains")
+				if sc in (403, 404) and ("coomer" in domain or "kemono" in domain):
+					response.close()
+					if self.update_progress_callback:
+						self.update_progress_callback(0, 0, status=f"{sc} - probing subdomains")
 
-						with self.subdomain_locks[path]:
-							if path in self.subdomain_cache:
-								alt_url = self.subdomain_cache[path]
-							else:
-								alt_url = self._find_valid_subdomain(url)
-								self.subdomain_cache[path] = alt_url
+					with self.subdomain_locks[self._node_cache_key(url)]:
+						alt_url = self._cached_node_url(url)
+						if not alt_url:
+							alt_url = self._find_valid_subdomain(url)
+							if alt_url != url:
+								self._remember_node(alt_url)
 
-						if alt_url != url:
-							found = urlparse(alt_url).netloc
-							if self.update_progress_callback:
-								self.update_progress_callback(0, 0, status=f"Subdomain found: {found}")
+					if alt_url != url:
+						found = urlparse(alt_url).netloc
+						if self.update_progress_callback:
+							self.update_progress_callback(0, 0, status=f"Subdomain found: {found}")
 
 
-							response = session.get(
-								alt_url,
-								stream=True,
-								headers=headers,
-								timeout=self.stream_read_timeout,
-							)
-							response.raise_for_status()
-							return response
-						else:
-							if self.update_progress_callback:
-								self.update_progress_callback(0, 0, status="Exhausted subdomains")
+						response = self._limited_get(session, alt_url, headers=headers, stream=True)
+						if response is None:
 							return None
+						response.raise_for_status()
+						return response
+					else:
+						if self.update_progress_callback:
+							self.update_progress_callback(0, 0, status="Exhausted subdomains")
+						return None
 
-					response.raise_for_status()
-					return response
+				response.raise_for_status()
+				return response
 
-				except requests.exceptions.RequestException as e:
-					status_code = getattr(e.response, 'status_code', None)
+			except requests.exceptions.RequestException as e:
+				status_code = getattr(e.response, 'status_code', None)
 
-					if isinstance(e, requests.exceptions.ReadTimeout):
-						self._log_retry(
-							attempt,
-							max_retries,
-							"Intento {attempt}/{max_retries_val}: Read timeout ({stream_timeout}s) - Reintentando...",
-							stream_timeout=self.stream_read_timeout,
-						)
-						if attempt < max_retries:
-							time.sleep(self.retry_interval)
-						continue
-
-					if status_code in (429, 500, 502, 503, 504):
-						self._log_retry(
-							attempt,
-							max_retries,
-							"Attempt {attempt}/{max_retries_val}: Error {status_code} - Retrying...",
-							status_code=status_code,
-						)
-						if attempt < max_retries:
-							time.sleep(self.retry_interval)
-					elif status_code not in (403, 404):
-						url_display = getattr(e.request, 'url', url)
-						if len(url_display) > 60:
-							url_display = url_display[:60] + "..."
-						self._log_retry(
-							attempt,
-							max_retries,
-							"Attempt {attempt}/{max_retries_val}: Error accessing {url} - {error}",
-							url=url_display,
-							error=e,
-						)
-						if attempt < max_retries:
-							time.sleep(self.retry_interval)
-					else:
-						self._log_retry(
-							attempt,
-							max_retries,
-							"Attempt {attempt}/{max_retries_val}: Error {status_code} - Retrying...",
-							status_code=status_code,
-						)
-						
-					if status_code in (403, 404) and ("coomer" in domain or "kemono" in domain) and attempt == max_retries:
-						self.log(self.tr("Fallo final al acceder a {url} con error {status_code}").format(url=url, status_code=status_code))
+				if isinstance(e, requests.exceptions.ReadTimeout):
+					self._log_retry(
+						attempt,
+						max_retries,
+						"Intento {attempt}/{max_retries_val}: Read timeout ({stream_timeout}s) - Reintentando...",
+						stream_timeout=self.stream_read_timeout,
+					)
+					retry_delay = self.retry_interval
+				elif status_code in (429, 500, 502, 503, 504):
+					self._log_retry(
+						attempt,
+						max_retries,
+						"Attempt {attempt}/{max_retries_val}: Error {status_code} - Retrying...",
+						status_code=status_code,
+					)
+					retry_delay = self.retry_interval
+				elif status_code not in (403, 404):
+					url_display = getattr(e.request, 'url', url)
+					if len(url_display) > 60:
+						url_display = url_display[:60] + "..."
+					self._log_retry(
+						attempt,
+						max_retries,
+						"Attempt {attempt}/{max_retries_val}: Error accessing {url} - {error}",
+						url=url_display,
+						error=e,
+					)
+					retry_delay = self.retry_interval
+				else:
+					self._log_retry(
+						attempt,
+						max_retries,
+						"Attempt {attempt}/{max_retries_val}: Error {status_code} - Retrying...",
+						status_code=status_code,
+					)
+					
+				if status_code in (403, 404) and ("coomer" in domain or "kemono" in domain) and attempt == max_retries:
+					self.log(self.tr("Fallo final al acceder a {url} con error {status_code}").format(url=url, status_code=status_code))
+
+			
+			if retry_delay and attempt < max_retries:
+				if self.cancel_requested.wait(retry_delay):
+					return None
 
 
 		return None
 
-	def _find_valid_subdomain(self, url, max_subdomains=10):
+	def _data_path(self, path):
+		if path.startswith("/data/"):
+			return path
+		return ("/data" + path) if not path.startswith("/data") else path
+
+	def _node_cache_key(self, url):
 		parsed = urlparse(url)
-		original_path = parsed.path
-		
-		path = original_path
-		if not original_path.startswith("/data/"):
-			path = ("/data" + original_path) if not original_path.startswith("/data") else original_path
+		host = parsed.netloc
+		if "coomer" in host:
+			family = "coomer"
+		elif "kemono" in host:
+			family = "kemono"
+		else:
+			return None
+		if parsed.path.startswith("/api/"):
+			return None
+		parts = [part for part in self._data_path(parsed.path).split("/") if part]
+		if len(parts) < 3:
+			return None
+		return f"{family}:/{parts[0]}/{parts[1]}"
+
+	def _cached_node_url(self, url):
+		key = self._node_cache_key(url)
+		entry = self.subdomain_cache.get(key) if key else None
+		if not entry:
+			return None
+		node, updated_at = entry
+		if time.time() - updated_at > self.subdomain_cache_ttl:
+			return None
+		parsed = urlparse(url)
+		if parsed.netloc == node:
+			return None
+		return parsed._replace(netloc=node, path=self._data_path(parsed.path)).geturl()
+
+	def _remember_node(self, url):
+		key = self._node_cache_key(url)
+		if not key:
+			return
+		node = urlparse(url).netloc
+		updated_at = time.time()
+		self.subdomain_cache[key] = (node, updated_at)
+		self.db_writer.execute(
+			"INSERT OR REPLACE INTO subdomain_nodes (prefix, node, updated_at) VALUES (?, ?, ?)",
+			(key, node, updated_at)
+		)
+
+	def _probe_node(self, test_url):
+		domain = urlparse(test_url).netloc
+		limiter = self.host_limiter.for_host(domain)
+		if not limiter.wait_for_start(self.cancel_requested):
+			return False
+		session = self._get_session()
+		try:
+			with limiter.connection():
+				resp = session.head(test_url, headers=self.headers, timeout=self.stream_read_timeout,
+									allow_redirects=True)
+				if resp.status_code in (405, 501):
+					range_headers = self.headers.copy()
+					range_headers['Range'] = 'bytes=0-0'
+					resp = session.get(test_url, headers=range_headers, timeout=self.stream_read_timeout,
+									   stream=True)
+					resp.close()
+			if resp.status_code in (200, 206):
+				return True
+			if self.update_progress_callback:
+				self.update_progress_callback(0, 0, status=f"Invalid subdomain: {domain}")
+		except requests.exceptions.ReadTimeout:
+			if self.update_progress_callback:
+				self.update_progress_callback(0, 0, status=f"Timeout in: {domain}")
+		except Exception:
+			if self.update_progress_callback:
+				self.update_progress_callback(0, 0, status=f"Invalid subdomain: {domain}")
+		return False
 
+	def _find_valid_subdomain(self, url, max_subdomains=10):
+		parsed = urlparse(url)
+		path = self._data_path(parsed.path)
 		host = parsed.netloc
 		
 		if "coomer" in host:
@@ -481,78 +639,99 @@ class Downloader:
 		else:
 			base_domains = [host]
 
-		session = self._get_session()
+		candidates = [parsed._replace(netloc=f"n{i}.{base}", path=path).geturl()
+					  for base in base_domains for i in range(1, max_subdomains + 1)]
+		if self.update_progress_callback:
+			self.update_progress_callback(0, 0, status=f"Testing {len(candidates)} subdomains")
 
-		for base in base_domains:
-			for i in range(1, max_subdomains + 1):
-				domain = f"n{i}.{base}"
-				test_url = parsed._replace(netloc=domain, path=path).geturl()
+		with self._session_lock:
+			if self._probe_executor is None:
+				self._probe_executor = ThreadPoolExecutor(max_workers=self.subdomain_probe_concurrency)
+			probe_executor = self._probe_executor
+		futures = {probe_executor.submit(self._probe_node, candidate): candidate for candidate in candidates}
+		try:
+			for future in as_completed(futures):
+				if self.cancel_requested.is_set():
+					break
+				if future.result():
+					return futures[future]
+		finally:
+			for future in futures:
+				future.cancel()
 
-				if self.update_progress_callback:
-					self.update_progress_callback(0, 0, status=f"Testing subdomain: {domain}")
+		return url
 
-				try:
-					resp = session.get(test_url, headers=self.headers,
-						timeout=self.stream_read_timeout, stream=True)
-					if resp.status_code == 200:
-						return test_url
-					else:
-						if self.update_progress_callback:
-							self.update_progress_callback(0, 0, status=f"Invalid subdomain: {domain}")
-				except requests.exceptions.ReadTimeout:
-					if self.update_progress_callback:
-						self.update_progress_callback(0, 0, status=f"Timeout in: {domain}")
-				except Exception:
-					if self.update_progress_callback:
-						self.update_progress_callback(0, 0, status=f"Invalid subdomain: {domain}")
+	def _fetch_posts_page(self, api_url):
+		session = self._get_session()
+		try:
+			response = self._limited_get(session, api_url, headers=self.headers)
+			if response is None:
+				return None
+			response.raise_for_status()
+			try:
+				posts_data = response.json()
+			except ValueError as e:
+				self.log(self.tr("Error al parsear JSON: {e}", e=e))
+				return None
+		except Exception as e:
+			self.log(self.tr("Error fetching user posts: {e}", e=e))
+			return None
 
-		return url
+		if isinstance(posts_data, dict) and 'data' in posts_data:
+			return posts_data['data'] or []
+		return posts_data or []
 
-	def fetch_user_posts(self, site, user_id, service, query=None, specific_post_id=None, initial_offset=0, log_fetching=True):
-		all_posts = []
-		offset = initial_offset
+	def iter_user_post_pages(self, site, user_id, service, query=None, initial_offset=0, log_fetching=True):
 		user_id_encoded = quote_plus(user_id)
-		session = self._get_session()
-		while True:
-			if self.cancel_requested.is_set():
-				return all_posts
 
+		def page_url(offset):
 			api_url = f"https://{site}/api/v1/{service}/user/{user_id_encoded}/posts"
 			url_query = {"o": offset}
 			if query is not None:
 				url_query["q"] = query
-			api_url += "?" + urlencode(url_query)
-			if log_fetching:
-				self.log(self.tr("Fetching user posts from {api_url}", api_url=api_url))
-			try:
+			return api_url + "?" + urlencode(url_query)
 
-				response = session.get(
-					api_url,
-					headers=self.headers,
-					timeout=self.stream_read_timeout,
-				)
-				response.raise_for_status()
-				try:
-					posts_data = response.json()
-				except ValueError as e:
-					self.log(self.tr("Error al parsear JSON: {e}", e=e))
-					break
-				
-				if isinstance(posts_data, dict) and 'data' in posts_data:
-					posts = posts_data['data']
-				else:
-					posts = posts_data
+		next_offset = initial_offset
+		in_flight = deque()
+		seen_ids = set()
+		pager = ThreadPoolExecutor(max_workers=self.page_concurrency)
+		try:
+			while True:
+				while len(in_flight) < self.page_concurrency and not self.cancel_requested.is_set():
+					api_url = page_url(next_offset)
+					if log_fetching:
+						self.log(self.tr("Fetching user posts from {api_url}", api_url=api_url))
+					in_flight.append(pager.submit(self._fetch_posts_page, api_url))
+					next_offset += 50
+
+				if self.cancel_requested.is_set() or not in_flight:
+					return
+
+				posts = in_flight.popleft().result()
 				if not posts:
-					break
-				if specific_post_id:
-					post = next((p for p in posts if p['id'] == specific_post_id), None)
-					if post:
-						return [post]
-				all_posts.extend(posts)
-				offset += 50
-			except Exception as e:
-				self.log(self.tr("Error fetching user posts: {e}", e=e))
-				break
+					return
+
+				unique_posts = []
+				for post in posts:
+					post_id = post.get('id') if isinstance(post, dict) else None
+					if post_id is not None:
+						if post_id in seen_ids:
+							continue
+						seen_ids.add(post_id)
+					unique_posts.append(post)
+				yield unique_posts
+		finally:
+			pager.shutdown(wait=False, cancel_futures=True)
+
+	def fetch_user_posts(self, site, user_id, service, query=None, specific_post_id=None, initial_offset=0, log_fetching=True):
+		all_posts = []
+		for posts in self.iter_user_post_pages(site, user_id, service, query=query,
+											   initial_offset=initial_offset, log_fetching=log_fetching):
+			if specific_post_id:
+				post = next((p for p in posts if p['id'] == specific_post_id), None)
+				if post:
+					return [post]
+			all_posts.extend(posts)
 		if specific_post_id:
 			return [post for post in all_posts if post['id'] == specific_post_id]
 		return all_posts
@@ -630,6 +809,21 @@ class Downloader:
 
 		return media_urls
 
+	def is_media_allowed(self, media_url):
+		extension = os.path.splitext(media_url)[1].lower()
+		return not ((extension in self.image_extensions and not self.download_images) or
+					(extension in self.video_extensions and not self.download_videos) or
+					(extension in self.compressed_extensions and not self.download_compressed))
+
+	def iter_media_jobs(self, posts, site):
+		for post in posts:
+			post_id = post.get('id') or "unknown_id"
+			title = post.get('title') or ""
+			published = post.get('published') or ""
+			for media_url in self.process_post(post, site):
+				if self.is_media_allowed(media_url):
+					yield media_url, post_id, title, published
+
 	def sanitize_filename(self, filename):
 		return re.sub(r'[<>:"/\\|?*]', '_', filename)
 
@@ -661,9 +855,7 @@ class Downloader:
 			return
 
 		extension = os.path.splitext(media_url)[1].lower()
-		if (extension in self.image_extensions and not self.download_images) or \
-		(extension in self.video_extensions and not self.download_videos) or \
-		(extension in self.compressed_extensions and not self.download_compressed):
+		if not self.is_media_allowed(media_url):
 			self.log(f"Skipping {media_url} due to settings.")
 			return
 
@@ -684,6 +876,7 @@ class Downloader:
 		partial_info = self.partial_downloads.get(media_url)
 		downloaded_size = 0
 		total_size = 0
+		segments = partial_info.get("segments") if partial_info else None
 		if partial_info:
 			stored_tmp_path = partial_info.get("tmp_path")
 			if stored_tmp_path and stored_tmp_path != tmp_path and os.path.exists(
@@ -695,7 +888,12 @@ class Downloader:
 					pass
 			total_size = partial_info.get("total_size", 0) or 0
 
-		if os.path.exists(tmp_path):
+		if segments and not os.path.exists(tmp_path):
+			segments = None
+		if segments:
+			downloaded_size = sum(done for _start, _end, done in segments)
+			self.log(f"Found segmented partial file ({downloaded_size} bytes) for {media_url}")
+		elif os.path.exists(tmp_path):
 			downloaded_size = os.path.getsize(tmp_path)
 			if downloaded_size > 0:
 				self.log(f"Found existing partial file ({downloaded_size} bytes) for {media_url}")
@@ -703,7 +901,8 @@ class Downloader:
 					"downloaded_size") > downloaded_size:
 				self.log("Stored progress is ahead of file size; using on-disk bytes instead.")
 
-		self.update_partial_download(media_url, tmp_path, downloaded_size, total_size, user_id, post_id)
+		self.update_partial_download(media_url, tmp_path, downloaded_size, total_size, user_id, post_id,
+									 segments=segments)
 		
 		if media_url in self.download_cache:
 			self.log(f"File from {media_url} is in DB, skipping.")
@@ -712,7 +911,39 @@ class Downloader:
 				self.remove_partial_download(media_url)
 			return
 
+		if self._reuse_local_copy(media_url, tmp_path, final_path, user_id, post_id):
+			return
+
 		self.log(f"Starting download from {media_url}")
+		with self.host_limiter.for_host(urlparse(media_url).netloc).transfers:
+			self._transfer_media(media_url, tmp_path, final_path, extension, segments, downloaded_size, total_size,
+								 user_id, post_id, download_id)
+
+	def _transfer_media(self, media_url, tmp_path, final_path, extension, segments, downloaded_size, total_size,
+						user_id, post_id, download_id):
+		limiter = self.host_limiter.for_host(urlparse(media_url).netloc)
+		if self.segmented_downloads and (segments or extension in self.segmented_extensions):
+			try:
+				if self._download_segmented(media_url, tmp_path, final_path, total_size, segments,
+											user_id, post_id, download_id):
+					return
+			except Exception as e:
+				if str(e) == "Cancellation Requested":
+					if os.path.exists(tmp_path):
+						os.remove(tmp_path)
+					self.remove_partial_download(media_url)
+					self.log(f"Download cancelled from {media_url}")
+				else:
+					self.log(f"Segmented download failed for {media_url}: {e}")
+					with self.file_lock:
+						self.failed_files.append(media_url)
+				return
+			if segments:
+				if os.path.exists(tmp_path):
+					os.remove(tmp_path)
+				self.remove_partial_download(media_url)
+				downloaded_size = 0
+				total_size = 0
 
 		for attempt in range(self.max_retries + 1):
 			if self.cancel_requested.is_set():
@@ -777,6 +1008,7 @@ class Downloader:
 						if chunk:
 							f.write(chunk)
 							downloaded_size += len(chunk)
+							limiter.record_bytes(len(chunk))
 							if time.time() - last_partial_update >= self.partial_update_interval:
 								self.update_partial_download(media_url, tmp_path, downloaded_size, total_size, user_id, post_id)
 								last_partial_update = time.time()
@@ -814,6 +1046,7 @@ class Downloader:
 							if chunk:
 								f.write(chunk)
 								downloaded_size += len(chunk)
+								limiter.record_bytes(len(chunk))
 							if time.time() - last_partial_update >= self.partial_update_interval:
 								self.update_partial_download(media_url, tmp_path, downloaded_size, total_size, user_id, post_id)
 								last_partial_update = time.time()
@@ -833,31 +1066,7 @@ class Downloader:
 				if total_size > 0 and downloaded_size != total_size:
 					raise Exception(f"Final size mismatch: expected {total_size}, got {downloaded_size}")
 
-				
-				with self.file_lock:
-					if os.path.exists(final_path):
-						os.remove(final_path)
-					os.rename(tmp_path, final_path)
-				self.remove_partial_download(media_url)
-
-				
-				with self.file_lock:
-					self.completed_files += 1
-				
-				self.log(f"Download success from {media_url}")
-				if self.update_global_progress_callback:
-					self.update_global_progress_callback(self.completed_files, self.total_files)
-
-				
-				with self.db_lock:
-					self.db_cursor.execute(
-						"""INSERT OR REPLACE INTO downloads (media_url, file_path, file_size, user_id, post_id)
-						VALUES (?, ?, ?, ?, ?)""",
-						(media_url, final_path, total_size, user_id, post_id)
-					)
-					self.db_connection.commit()
-
-				self.download_cache[media_url] = (final_path, total_size)
+				self._finalize_download(media_url, tmp_path, final_path, total_size, user_id, post_id)
 				return
 			except Exception as e:
 				
@@ -878,6 +1087,195 @@ class Downloader:
 			self.failed_files.append(media_url)
 
 
+	def _find_local_copy(self, content_hash):
+		candidates = []
+		if content_hash in self.content_hash_paths:
+			candidates.append(self.content_hash_paths[content_hash])
+		with self.db_lock:
+			self.db_cursor.execute("SELECT file_path, file_size FROM downloads WHERE content_hash = ?", (content_hash,))
+			candidates.extend(self.db_cursor.fetchall())
+		for file_path, file_size in candidates:
+			if file_path and os.path.isfile(file_path) and (not file_size or os.path.getsize(file_path) == file_size):
+				return file_path
+		return None
+
+	def _reuse_local_copy(self, media_url, tmp_path, final_path, user_id, post_id):
+		content_hash = content_hash_from_url(media_url)
+		source_path = self._find_local_copy(content_hash) if content_hash else None
+		if not source_path:
+			return False
+
+		if self.duplicate_handling == 'skip' and os.path.normpath(source_path) != final_path:
+			self.log(f"Identical file already downloaded to {source_path}, skipping {media_url}.")
+			with self.file_lock:
+				self.skipped_files.append(final_path)
+				self.remove_partial_download(media_url)
+			return True
+
+		if os.path.normpath(source_path) != final_path:
+			try:
+				with self.file_lock:
+					method = place_duplicate(source_path, final_path, self.duplicate_handling)
+			except OSError as e:
+				self.log(f"Could not reuse {source_path} for {media_url}: {e}")
+				return False
+			self.log(f"Identical file already downloaded; created {final_path} from {source_path} ({method}).")
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		self.remove_partial_download(media_url)
+		self._record_download(media_url, final_path, os.path.getsize(final_path), user_id, post_id)
+		return True
+
+	def _finalize_download(self, media_url, tmp_path, final_path, total_size, user_id, post_id):
+		
+		with self.file_lock:
+			if os.path.exists(final_path):
+				os.remove(final_path)
+			os.rename(tmp_path, final_path)
+		self.remove_partial_download(media_url)
+
+		self.log(f"Download success from {media_url}")
+		self._record_download(media_url, final_path, total_size, user_id, post_id)
+
+	def _record_download(self, media_url, final_path, total_size, user_id, post_id):
+		with self.file_lock:
+			self.completed_files += 1
+		
+		if self.update_global_progress_callback:
+			self.update_global_progress_callback(self.completed_files, self.total_files)
+
+		content_hash = content_hash_from_url(media_url)
+		self.db_writer.execute(
+			"""INSERT OR REPLACE INTO downloads (media_url, file_path, file_size, user_id, post_id, content_hash)
+			VALUES (?, ?, ?, ?, ?, ?)""",
+			(media_url, final_path, total_size, user_id, post_id, content_hash)
+		)
+
+		self.download_cache[media_url] = (final_path, total_size)
+		if content_hash:
+			self.content_hash_paths[content_hash] = (final_path, total_size)
+
+	def _probe_range_support(self, media_url):
+		probe_headers = self.headers.copy()
+		probe_headers['Range'] = 'bytes=0-0'
+		response = self.safe_request(media_url, max_retries=self.max_retries, headers=probe_headers)
+		if response is None:
+			return None, 0
+		try:
+			if response.status_code != 206:
+				return None, 0
+			match = re.search(r'/([0-9]+)$', response.headers.get('content-range', ''))
+			return response.url or media_url, int(match.group(1)) if match else 0
+		finally:
+			response.close()
+
+	def _plan_segments(self, total_size):
+		count = max(1, min(self.segment_count, total_size // self.min_segment_size))
+		segment_size = -(-total_size // count)
+		return [[start, min(start + segment_size, total_size) - 1, 0]
+				for start in range(0, total_size, segment_size)]
+
+	def _download_segmented(self, media_url, tmp_path, final_path, total_size, segments, user_id, post_id, download_id):
+		source_url, remote_size = self._probe_range_support(media_url)
+		if not source_url or not remote_size:
+			return False
+		if segments and remote_size != total_size:
+			self.log(f"Remote size changed for {media_url}; restarting segmented download.")
+			segments = None
+		if not segments:
+			if remote_size < self.segment_threshold:
+				return False
+			segments = self._plan_segments(remote_size)
+		total_size = remote_size
+		limiter = self.host_limiter.for_host(urlparse(source_url).netloc)
+
+		with open(tmp_path, 'r+b' if os.path.exists(tmp_path) else 'w+b') as f:
+			f.truncate(total_size)
+
+		self.log(f"Downloading {media_url} in {len(segments)} segments")
+		progress_lock = threading.Lock()
+		start_time = time.time()
+		resumed_bytes = sum(done for _start, _end, done in segments)
+		last_update = {"partial": time.time(), "progress": 0.0}
+
+		def report_progress(force=False):
+			now = time.time()
+			with progress_lock:
+				downloaded = sum(done for _start, _end, done in segments)
+				snapshot = [list(segment) for segment in segments]
+				save_partial = force or now - last_update["partial"] >= self.partial_update_interval
+				if save_partial:
+					last_update["partial"] = now
+				show_progress = force or now - last_update["progress"] >= 0.5
+				if show_progress:
+					last_update["progress"] = now
+			if save_partial:
+				self.update_partial_download(media_url, tmp_path, downloaded, total_size, user_id, post_id,
+											 segments=snapshot)
+			if show_progress and self.update_progress_callback:
+				elapsed = now - start_time
+				speed = (downloaded - resumed_bytes) / elapsed if elapsed > 0 else 0
+				remaining = total_size - downloaded
+				eta = remaining / speed if speed > 0 and remaining > 0 else 0
+				self.update_progress_callback(downloaded, total_size, file_id=download_id, file_path=tmp_path,
+											  speed=speed, eta=eta)
+
+		def fetch_segment(index):
+			start, end = segments[index][0], segments[index][1]
+			for attempt in range(self.max_retries + 1):
+				if start + segments[index][2] > end:
+					return True
+				if self.cancel_requested.is_set() or not self.wait_if_paused():
+					raise Exception("Cancellation Requested")
+
+				range_headers = self.headers.copy()
+				range_headers['Range'] = f'bytes={start + segments[index][2]}-{end}'
+				response = self.safe_request(source_url, max_retries=self.max_retries, headers=range_headers)
+				if response is None:
+					if attempt < self.max_retries:
+						time.sleep(self.retry_interval)
+					continue
+				try:
+					if response.status_code != 206:
+						return False
+					with open(tmp_path, 'r+b') as f:
+						f.seek(start + segments[index][2])
+						for chunk in response.iter_content(chunk_size=1048576):
+							if self.cancel_requested.is_set() or not self.wait_if_paused():
+								raise Exception("Cancellation Requested")
+							if not chunk:
+								continue
+							chunk = chunk[:end - (start + segments[index][2]) + 1]
+							f.write(chunk)
+							limiter.record_bytes(len(chunk))
+							with progress_lock:
+								segments[index][2] += len(chunk)
+							report_progress()
+							if start + segments[index][2] > end:
+								break
+				except requests.exceptions.RequestException:
+					pass
+				finally:
+					response.close()
+				if start + segments[index][2] > end:
+					return True
+				if attempt < self.max_retries:
+					time.sleep(self.retry_interval)
+			return False
+
+		with ThreadPoolExecutor(max_workers=len(segments)) as segment_pool:
+			results = list(segment_pool.map(fetch_segment, range(len(segments))))
+
+		report_progress(force=True)
+		if not all(results):
+			self.log(f"Segmented download incomplete for {media_url}; progress saved for resume.")
+			with self.file_lock:
+				self.failed_files.append(media_url)
+			return True
+
+		self._finalize_download(media_url, tmp_path, final_path, total_size, user_id, post_id)
+		return True
+
 	def get_remote_file_size(self, media_url, filename):
 		try:
 			response = requests.head(
@@ -900,80 +1298,62 @@ class Downloader:
 			self.log(self.tr("Starting download process..."))
 
 			log_fetching = download_all or bool(selected_post_ids)
-			posts = self.fetch_user_posts(
-				site, user_id, service,
-				query=query,
-				initial_offset=initial_offset,
-				log_fetching=log_fetching
-			)
-			if not posts:
-				self.log(self.tr("No posts found for this user."))
-				return
+			if self.stream_posts:
+				pages = self.iter_user_post_pages(
+					site, user_id, service,
+					query=query,
+					initial_offset=initial_offset,
+					log_fetching=log_fetching
+				)
+			else:
+				posts = self.fetch_user_posts(
+					site, user_id, service,
+					query=query,
+					initial_offset=initial_offset,
+					log_fetching=log_fetching
+				)
+				pages = [posts] if posts else []
 
-			if selected_post_ids is not None:
-				selected_set = set(selected_post_ids)
-				posts = [post for post in posts if post.get('id') in selected_set]
-				if not posts:
-					self.log(self.tr("No valid posts were selected for download."))
-					return
-			elif not download_all:
-				
-				posts = posts[:50]
+			selected_set = set(selected_post_ids) if selected_post_ids is not None else None
+			pending_selection = set(selected_set) if selected_set is not None else None
+			post_limit = None if download_all or selected_set is not None else 50
+			found_posts = 0
+			queued_posts = 0
 
 			self.total_files = 0
-			for post in posts:
-
-				if not self.wait_if_paused():
-					return
-
-				current_post_id = post.get('id') or "unknown_id"
-				
-				title = post.get('title') or ""
-
-				
-				media_urls = self.process_post(post, site)
-
-
-				for media_url in media_urls:
-					ext = os.path.splitext(media_url)[1].lower()
-					if (ext in self.image_extensions and not self.download_images) or \
-					   (ext in self.video_extensions and not self.download_videos) or \
-					   (ext in self.compressed_extensions and not self.download_compressed):
-						continue
-
-					
-					self.total_files += 1
-
 			self._reset_futures()
 			futures = []
-			for post in posts:
-				if not self.wait_if_paused():
+			for posts in pages:
+				if not self.wait_if_paused() or self.cancel_requested.is_set():
 					self._cancel_futures(futures)
 					return
-				if self.cancel_requested.is_set():
-					self._cancel_futures(futures)
-					return
-				current_post_id = post.get('id') or "unknown_id"
-				title = post.get('title') or ""
-				time = post.get('published') or ""
 
-				media_urls = self.process_post(post, site)
-				for media_url in media_urls:
-					ext = os.path.splitext(media_url)[1].lower()
-					if (ext in self.image_extensions and not self.download_images) or \
-					   (ext in self.video_extensions and not self.download_videos) or \
-					   (ext in self.compressed_extensions and not self.download_compressed):
-						continue
+				found_posts += len(posts)
+				if selected_set is not None:
+					posts = [post for post in posts if post.get('id') in selected_set]
+					pending_selection.difference_update(post.get('id') for post in posts)
+				elif post_limit is not None:
+					posts = posts[:post_limit - queued_posts]
+				queued_posts += len(posts)
+
+				jobs = list(self.iter_media_jobs(posts, site))
+				self.total_files += len(jobs)
+				if jobs and self.update_global_progress_callback:
+					self.update_global_progress_callback(self.completed_files, self.total_files)
+
+				for media_url, post_id, title, published in jobs:
+					if not self.wait_if_paused() or self.cancel_requested.is_set():
+						self._cancel_futures(futures)
+						return
 
-					
 					if self.download_mode == 'queue':
 						
 						self.process_media_element(
 							media_url,
 							user_id,
-							post_id=current_post_id,
+							post_id=post_id,
 							post_name=title,
-							post_time=time
+							post_time=published
 						)
 					else:
 						
@@ -981,14 +1361,26 @@ class Downloader:
 							self.process_media_element,
 							media_url,
 							user_id,
-							current_post_id,
+							post_id,
 							title,
-							time,
+							published,
 							media_url
 						)
 						self._register_future(future)
 						futures.append(future)
 
+				if post_limit is not None and queued_posts >= post_limit:
+					break
+				if pending_selection is not None and not pending_selection:
+					break
+
+			if not found_posts:
+				self.log(self.tr("No posts found for this user."))
+				return
+			if selected_set is not None and not queued_posts:
+				self.log(self.tr("No valid posts were selected for download."))
+				return
+
 			
 			if self.download_mode == 'multi':
 				if self.cancel_requested.is_set():
@@ -1050,12 +1442,9 @@ class Downloader:
 		self.log(self.tr(f"Fetching post from {api_url}"))
 		session = self._get_session()
 		try:
-			with self.rate_limit:
-				response = session.get(
-					api_url,
-					headers=self.headers,
-					timeout=self.stream_read_timeout,
-				)
+			response = self._limited_get(session, api_url, headers=self.headers)
+			if response is None:
+				return None
 			response.raise_for_status()
 			return response.json()
 		except Exception as e:
@@ -1064,9 +1453,8 @@ class Downloader:
 
 	def clear_database(self):
 		
-		with self.db_lock:
-			self.db_cursor.execute("DELETE FROM downloads")
-			self.db_connection.commit()
+		self.db_writer.execute("DELETE FROM downloads")
+		self.db_writer.flush()
 		self.log(self.tr("Database cleared."))
 	
 	def update_max_downloads(self, new_max):
@@ -1077,6 +1465,6 @@ class Downloader:
 
 		self.max_workers = new_max
 		self.executor = ThreadPoolExecutor(max_workers=new_max)
-		self.rate_limit = Semaphore(new_max)
+		self.host_limiter.set_defaults(max_connections=new_max)
 
 		self.log(f"Updated max_workers to {new_max}")
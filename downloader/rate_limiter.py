@@ -0,0 +1,217 @@
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from downloader.concurrency import AdaptiveConcurrency
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class TokenBucket:
+    """Request-start limiter. A rate of 0 disables limiting."""
+
+    def __init__(self, rate, burst=1):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.burst = 1.0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.configure(rate, burst)
+        self._tokens = self.burst
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self._refill()
+            self.rate = max(0.0, float(rate or 0))
+            if burst is not None:
+                self.burst = max(1.0, float(burst))
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        else:
+            self._tokens = self.burst
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        # Tokens may go negative: each caller gets its own slot in the future
+        # and sleeps for it without holding the lock.
+        with self._lock:
+            self._refill()
+            if self.rate <= 0:
+                return 0.0
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1, cancel_event=None):
+        delay = self.reserve(tokens)
+        if delay <= 0:
+            return True
+        if cancel_event is not None:
+            return not cancel_event.wait(delay)
+        time.sleep(delay)
+        return True
+
+
+class ConnectionLimit:
+    """Counting semaphore whose limit can be changed while it is held."""
+
+    def __init__(self, limit):
+        self._condition = threading.Condition()
+        self._limit = max(1, int(limit))
+        self._active = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def active(self):
+        return self._active
+
+    def set_limit(self, limit):
+        with self._condition:
+            self._limit = max(1, int(limit))
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active = max(0, self._active - 1)
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class HostLimiter:
+    """``connections`` caps in-flight requests, ``transfers`` caps files being
+    streamed from the host. With adaptive concurrency the controller moves
+    the transfer limit between 1 and ``max_connections``."""
+
+    def __init__(self, rate, burst, max_connections, adaptive=False, on_limit_change=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.connections = ConnectionLimit(max_connections)
+        self.transfers = ConnectionLimit(max_connections)
+        self.controller = None
+        if adaptive:
+            self.controller = AdaptiveConcurrency(self.transfers, max_limit=max_connections,
+                                                  on_change=on_limit_change)
+
+    def wait_for_start(self, cancel_event=None):
+        return self.bucket.acquire(cancel_event=cancel_event)
+
+    @contextmanager
+    def connection(self):
+        with self.connections:
+            yield
+
+    def set_max_connections(self, max_connections):
+        self.connections.set_limit(max_connections)
+        if self.controller:
+            self.controller.set_max_limit(max_connections)
+        else:
+            self.transfers.set_limit(max_connections)
+
+    def record_response(self, status_code, ttfb, retry_after=None):
+        if self.controller:
+            self.controller.record_response(status_code, ttfb, retry_after)
+
+    def record_bytes(self, count):
+        if self.controller:
+            self.controller.record_bytes(count)
+
+
+class HostRateLimiter:
+    """Per-host limiters. Hosts configured in ``host_limits`` (exact name or
+    parent domain, e.g. ``coomer.st`` also covers ``n3.coomer.st``) share one
+    limiter; every other host gets its own limiter with the defaults."""
+
+    def __init__(self, requests_per_second=1.0, burst=1, max_connections=5, host_limits=None,
+                 adaptive=False, on_limit_change=None):
+        self._lock = threading.Lock()
+        self.adaptive = adaptive
+        self.on_limit_change = on_limit_change
+        self._limiters = {}
+        self.default_rate = requests_per_second
+        self.default_burst = burst
+        self.default_max_connections = max_connections
+        self.host_limits = {}
+        for host, options in (host_limits or {}).items():
+            if isinstance(options, dict):
+                self.host_limits[host.lower().lstrip(".")] = options
+
+    def _config_key(self, host):
+        host = (host or "").lower()
+        candidate = host
+        while candidate:
+            if candidate in self.host_limits:
+                return candidate
+            if "." not in candidate:
+                break
+            candidate = candidate.split(".", 1)[1]
+        return None
+
+    def _build(self, key):
+        options = self.host_limits.get(key, {})
+        return HostLimiter(
+            options.get("requests_per_second", self.default_rate),
+            options.get("burst", self.default_burst),
+            options.get("max_connections", self.default_max_connections),
+            adaptive=options.get("adaptive", self.adaptive),
+            on_limit_change=self._limit_callback(key),
+        )
+
+    def _limit_callback(self, key):
+        if self.on_limit_change is None:
+            return None
+        return lambda limit: self.on_limit_change(key, limit)
+
+    def for_host(self, host):
+        key = self._config_key(host) or (host or "").lower()
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = self._build(key)
+            return limiter
+
+    def set_defaults(self, requests_per_second=None, burst=None, max_connections=None):
+        with self._lock:
+            if requests_per_second is not None:
+                self.default_rate = requests_per_second
+            if burst is not None:
+                self.default_burst = burst
+            if max_connections is not None:
+                self.default_max_connections = max_connections
+            limiters = list(self._limiters.items())
+        for key, limiter in limiters:
+            options = self.host_limits.get(key, {})
+            limiter.bucket.configure(options.get("requests_per_second", self.default_rate),
+                                     options.get("burst", self.default_burst))
+            limiter.set_max_connections(options.get("max_connections", self.default_max_connections))
@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+
+from downloader.concurrency import AdaptiveConcurrency
+from downloader.rate_limiter import ConnectionLimit, HostRateLimiter, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("downloader.concurrency.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limit = ConnectionLimit(8)
+        self.changes = []
+        self.controller = AdaptiveConcurrency(self.limit, max_limit=8, window=5.0,
+                                              on_change=self.changes.append)
+
+    def saturate(self):
+        while self.limit.active < self.limit.limit:
+            self.limit.acquire()
+
+    def run_window(self, bytes_per_second, ttfb=0.2):
+        self.controller.record_response(200, ttfb)
+        self.clock.now += 5.0
+        self.controller.record_bytes(int(bytes_per_second * 5))
+
+    def test_starts_at_half_of_the_maximum(self):
+        self.assertEqual(self.controller.limit, 4)
+
+    def test_limit_grows_while_throughput_grows(self):
+        self.saturate()
+        self.run_window(1000)
+        self.assertEqual(self.controller.limit, 5)
+
+        self.saturate()
+        self.run_window(2000)
+        self.assertEqual(self.controller.limit, 6)
+        self.assertEqual(self.changes, [5, 6])
+
+    def test_limit_holds_when_throughput_stops_growing(self):
+        self.saturate()
+        self.run_window(1000)
+        self.saturate()
+        self.run_window(1000)
+
+        self.assertEqual(self.controller.limit, 5)
+
+    def test_limit_holds_when_latency_rises(self):
+        self.saturate()
+        self.run_window(1000, ttfb=0.2)
+        self.saturate()
+        self.run_window(5000, ttfb=1.0)
+
+        self.assertEqual(self.controller.limit, 5)
+
+    def test_limit_does_not_grow_when_host_is_not_saturated(self):
+        self.run_window(1000)
+
+        self.assertEqual(self.controller.limit, 4)
+
+    def test_throttle_halves_limit_once_per_cooldown(self):
+        self.controller.record_response(429, 0.1)
+        self.controller.record_response(503, 0.1)
+        self.assertEqual(self.controller.limit, 2)
+
+        self.clock.now += 30
+        self.controller.record_response(200, 0.1, retry_after=20)
+        self.assertEqual(self.controller.limit, 1)
+
+    def test_no_growth_during_retry_after_cooldown(self):
+        self.controller.record_throttle(retry_after=60)
+        self.saturate()
+        self.run_window(1000)
+
+        self.assertEqual(self.controller.limit, 2)
+
+    def test_lowering_the_maximum_clamps_the_limit(self):
+        self.controller.set_max_limit(2)
+
+        self.assertEqual(self.controller.limit, 2)
+
+
+class AdaptiveHostLimiterTests(unittest.TestCase):
+    def test_adaptive_hosts_get_a_controller(self):
+        limiter = HostRateLimiter(max_connections=6, adaptive=True)
+
+        host = limiter.for_host("n1.coomer.st")
+
+        self.assertIsNotNone(host.controller)
+        self.assertEqual(host.transfers.limit, 3)
+        self.assertEqual(host.connections.limit, 6)
+
+    def test_static_hosts_follow_max_connections(self):
+        limiter = HostRateLimiter(max_connections=6)
+        host = limiter.for_host("n1.coomer.st")
+
+        limiter.set_defaults(max_connections=2)
+
+        self.assertIsNone(host.controller)
+        self.assertEqual(host.transfers.limit, 2)
+
+
+class RetryAfterTests(unittest.TestCase):
+    def test_parses_seconds_and_rejects_garbage(self):
+        self.assertEqual(parse_retry_after("12"), 12.0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_past_http_date_is_zero(self):
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from downloader import dedupe
+from downloader.dedupe import content_hash_from_url, place_duplicate
+from downloader.downloader import Downloader
+
+SHA = "0f" * 32
+
+
+class ContentHashTests(unittest.TestCase):
+    def test_hash_is_parsed_from_data_paths(self):
+        self.assertEqual(content_hash_from_url(f"https://n2.coomer.st/data/0f/0f/{SHA}.mp4?f=clip.mp4"), SHA)
+        self.assertEqual(content_hash_from_url(f"https://kemono.cr/0f/0f/{SHA.upper()}.jpg"), SHA)
+        self.assertIsNone(content_hash_from_url("https://coomer.st/data/ab/cd/short.jpg"))
+
+    def test_copy_is_used_when_links_are_unavailable(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        source = os.path.join(temp_dir, "a.jpg")
+        target = os.path.join(temp_dir, "b.jpg")
+        with open(source, "wb") as f:
+            f.write(b"data")
+
+        with mock.patch.object(dedupe.os, "link", side_effect=OSError), \
+                mock.patch.object(dedupe, "_reflink", side_effect=OSError):
+            method = place_duplicate(source, target)
+
+        self.assertEqual(method, "copy")
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+
+class ContentDedupeTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.temp_dir, "config")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_downloader(self, **kwargs):
+        downloader = Downloader(self.temp_dir, config_dir=self.config_dir, tr=lambda message, **kw: message,
+                                **kwargs)
+        downloader.log = lambda *args, **kw: None
+        self.addCleanup(downloader.db_connection.close)
+        self.addCleanup(downloader.shutdown_executor)
+        return downloader
+
+    def seed_existing_file(self, downloader):
+        existing = os.path.join(self.temp_dir, "other", "images", "first.jpg")
+        os.makedirs(os.path.dirname(existing))
+        with open(existing, "wb") as f:
+            f.write(b"image-bytes")
+        downloader._record_download(f"https://n1.coomer.st/data/0f/0f/{SHA}.jpg", existing, 11, "other", "1")
+        downloader.db_writer.flush()
+        return existing
+
+    def test_repost_is_hardlinked_without_network(self):
+        downloader = self.create_downloader()
+        existing = self.seed_existing_file(downloader)
+        downloader.content_hash_paths.clear()
+        downloader.safe_request = mock.Mock(side_effect=AssertionError("network used"))
+
+        downloader.process_media_element(f"https://coomer.st/0f/0f/{SHA}.jpg", "user", post_id="2")
+
+        images_dir = os.path.join(self.temp_dir, "user", "images")
+        final_path = os.path.join(images_dir, os.listdir(images_dir)[0])
+        self.assertTrue(os.path.samefile(final_path, existing))
+        self.assertEqual(downloader.completed_files, 2)
+
+    def test_skip_mode_does_not_create_a_file(self):
+        downloader = self.create_downloader(duplicate_handling="skip")
+        self.seed_existing_file(downloader)
+        downloader.safe_request = mock.Mock(side_effect=AssertionError("network used"))
+
+        downloader.process_media_element(f"https://coomer.st/0f/0f/{SHA}.jpg", "user", post_id="2")
+
+        self.assertEqual(len(downloader.skipped_files), 1)
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir, "user", "images")), [])
+
+    def test_existing_rows_are_backfilled_on_upgrade(self):
+        os.makedirs(self.config_dir)
+        with sqlite3.connect(os.path.join(self.config_dir, "downloads.db")) as conn:
+            conn.execute("""
+                CREATE TABLE downloads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    media_url TEXT UNIQUE,
+                    file_path TEXT,
+                    file_size INTEGER,
+                    user_id TEXT,
+                    post_id TEXT,
+                    downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("INSERT INTO downloads (media_url, file_path) VALUES (?, ?)",
+                         (f"https://coomer.st/data/0f/0f/{SHA}.jpg", "a.jpg"))
+            conn.execute("INSERT INTO downloads (media_url, file_path) VALUES (?, ?)",
+                         ("https://example.com/b.jpg", "b.jpg"))
+
+        downloader = self.create_downloader()
+
+        rows = downloader.db_connection.execute(
+            "SELECT file_path, content_hash FROM downloads ORDER BY id").fetchall()
+        self.assertEqual(rows, [("a.jpg", SHA), ("b.jpg", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
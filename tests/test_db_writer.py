@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from downloader.db_writer import DatabaseWriter
+
+
+class DatabaseWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test.db")
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE items (key TEXT PRIMARY KEY, value INTEGER)")
+        self.errors = []
+        self.writer = DatabaseWriter(self.db_path, commit_interval=0.05, idle_timeout=0.1,
+                                     on_error=self.errors.append)
+
+    def tearDown(self):
+        self.writer.flush(timeout=5)
+        shutil.rmtree(self.temp_dir)
+
+    def read_items(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return dict(conn.execute("SELECT key, value FROM items").fetchall())
+        finally:
+            conn.close()
+
+    def test_queued_writes_are_visible_to_other_connections_after_flush(self):
+        for index in range(100):
+            self.writer.execute("INSERT OR REPLACE INTO items (key, value) VALUES (?, ?)", ("a", index))
+        self.writer.executemany("INSERT INTO items (key, value) VALUES (?, ?)", [("b", 1), ("c", 2)])
+        self.writer.execute("DELETE FROM items WHERE key = ?", ("c",))
+
+        self.assertTrue(self.writer.flush(timeout=5))
+
+        self.assertEqual(self.read_items(), {"a": 99, "b": 1})
+
+    def test_database_uses_wal_journal(self):
+        self.writer.execute("INSERT INTO items (key, value) VALUES (?, ?)", ("a", 1))
+        self.writer.flush(timeout=5)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        finally:
+            conn.close()
+
+    def test_failed_statement_does_not_drop_the_batch(self):
+        self.writer.execute("INSERT INTO missing (key) VALUES (?)", ("a",))
+        self.writer.execute("INSERT INTO items (key, value) VALUES (?, ?)", ("b", 2))
+
+        self.writer.flush(timeout=5)
+
+        self.assertEqual(self.read_items(), {"b": 2})
+        self.assertEqual(len(self.errors), 1)
+
+    def test_writer_thread_restarts_after_going_idle(self):
+        self.writer.execute("INSERT INTO items (key, value) VALUES (?, ?)", ("a", 1))
+        self.writer.flush(timeout=5)
+        first_thread = self.writer._thread
+        first_thread.join(timeout=5)
+        self.assertIsNone(self.writer._thread)
+
+        self.writer.execute("INSERT INTO items (key, value) VALUES (?, ?)", ("b", 2))
+        self.writer.flush(timeout=5)
+
+        self.assertEqual(self.read_items(), {"a": 1, "b": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from downloader.download_cache import BloomFilter, DownloadCache
+
+
+class DownloadCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "downloads.db")
+        self.filter_path = os.path.join(self.temp_dir, "downloads.bloom")
+        self.create_table()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_table(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE downloads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    media_url TEXT UNIQUE,
+                    file_path TEXT,
+                    file_size INTEGER
+                )
+            """)
+        self.insert("https://coomer.st/data/a.jpg")
+        self.insert("https://coomer.st/data/b.jpg")
+
+    def insert(self, media_url):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO downloads (media_url, file_path, file_size) VALUES (?, ?, ?)",
+                         (media_url, "/tmp/" + media_url.rsplit("/", 1)[1], 10))
+
+    def test_membership_is_answered_from_the_table(self):
+        cache = DownloadCache(self.db_path, self.filter_path)
+        try:
+            self.assertIn("https://coomer.st/data/a.jpg", cache)
+            self.assertNotIn("https://coomer.st/data/c.jpg", cache)
+            self.assertEqual(cache.get("https://coomer.st/data/b.jpg"), ("/tmp/b.jpg", 10))
+        finally:
+            cache.close()
+
+    def test_new_entries_are_visible_before_they_reach_the_table(self):
+        cache = DownloadCache(self.db_path, self.filter_path)
+        try:
+            cache["https://coomer.st/data/c.jpg"] = ("/tmp/c.jpg", 5)
+
+            self.assertIn("https://coomer.st/data/c.jpg", cache)
+            self.assertEqual(cache.get("https://coomer.st/data/c.jpg"), ("/tmp/c.jpg", 5))
+        finally:
+            cache.close()
+
+    def test_saved_filter_is_reused_and_caught_up_with_new_rows(self):
+        DownloadCache(self.db_path, self.filter_path).close()
+        self.assertFalse(os.path.exists(self.filter_path))
+
+        cache = DownloadCache(self.db_path, self.filter_path)
+        self.assertIn("https://coomer.st/data/a.jpg", cache)
+        cache.close()
+        self.assertTrue(os.path.exists(self.filter_path))
+
+        self.insert("https://coomer.st/data/d.jpg")
+        cache = DownloadCache(self.db_path, self.filter_path)
+        try:
+            with mock.patch.object(BloomFilter, "__init__", side_effect=AssertionError("rebuilt")):
+                self.assertIn("https://coomer.st/data/d.jpg", cache)
+                self.assertIn("https://coomer.st/data/a.jpg", cache)
+        finally:
+            cache.close()
+
+    def test_filter_is_rebuilt_when_the_table_was_recreated(self):
+        cache = DownloadCache(self.db_path, self.filter_path)
+        self.assertIn("https://coomer.st/data/a.jpg", cache)
+        cache["https://coomer.st/data/x.jpg"] = ("/tmp/x.jpg", 1)
+        self.insert("https://coomer.st/data/x.jpg")
+        cache.close()
+
+        os.remove(self.db_path)
+        self.create_table()
+        cache = DownloadCache(self.db_path, self.filter_path)
+        try:
+            self.assertIn("https://coomer.st/data/b.jpg", cache)
+            self.assertNotIn("https://coomer.st/data/x.jpg", cache._filter)
+        finally:
+            cache.close()
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_false_positive_rate_stays_near_target(self):
+        bloom = BloomFilter(2000, error_rate=0.01)
+        for index in range(2000):
+            bloom.add(f"https://coomer.st/data/{index}.jpg")
+
+        self.assertTrue(all(f"https://coomer.st/data/{index}.jpg" in bloom for index in range(2000)))
+        false_positives = sum(f"https://kemono.cr/data/{index}.jpg" in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,7 +12,8 @@ class SafeRequestRetryTests(unittest.TestCase):
     def _create_downloader(self, tmpdir, log_callback):
         with mock.patch.object(Downloader, "init_db"), \
                 mock.patch.object(Downloader, "load_download_cache"), \
-                mock.patch.object(Downloader, "load_partial_downloads"):
+                mock.patch.object(Downloader, "load_partial_downloads"), \
+                mock.patch.object(Downloader, "load_subdomain_nodes"):
             downloader = Downloader(
                 tmpdir,
                 max_retries=1,
@@ -100,5 +101,99 @@ class SafeRequestRetryTests(unittest.TestCase):
         self.assertGreaterEqual(len(unique_sessions), expected_sessions)
 
 
+class StreamingDownloadTests(unittest.TestCase):
+    def _create_downloader(self, tmpdir):
+        with mock.patch.object(Downloader, "init_db"), \
+                mock.patch.object(Downloader, "load_download_cache"), \
+                mock.patch.object(Downloader, "load_partial_downloads"), \
+                mock.patch.object(Downloader, "load_subdomain_nodes"):
+            downloader = Downloader(tmpdir, tr=lambda text, **kwargs: text)
+        downloader.download_cache = {}
+        downloader.partial_downloads = {}
+        downloader.download_mode = "queue"
+        return downloader
+
+    def test_download_media_dispatches_each_page_before_fetching_the_next(self):
+        events = []
+
+        def pages(*args, **kwargs):
+            events.append("page-1")
+            yield [{"id": "1", "file": {"path": "/data/a.jpg"}}]
+            events.append("page-2")
+            yield [{"id": "2", "file": {"path": "/data/b.jpg"}}]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            downloader = self._create_downloader(tmpdir)
+            totals = []
+            downloader.update_global_progress_callback = lambda completed, total: totals.append(total)
+            with mock.patch.object(downloader, "iter_user_post_pages", side_effect=pages), \
+                    mock.patch.object(downloader, "process_media_element",
+                                      side_effect=lambda url, *args, **kwargs: events.append(url)):
+                downloader.download_media("coomer.st", "user", "onlyfans", download_all=True)
+
+        self.assertEqual(events, [
+            "page-1", "https://coomer.st/data/a.jpg",
+            "page-2", "https://coomer.st/data/b.jpg",
+        ])
+        self.assertEqual(totals, [1, 2])
+
+    def test_download_media_stops_paging_once_selected_posts_are_found(self):
+        fetched = []
+
+        def pages(*args, **kwargs):
+            for post_id in ("1", "2", "3"):
+                fetched.append(post_id)
+                yield [{"id": post_id, "file": {"path": f"/data/{post_id}.jpg"}}]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            downloader = self._create_downloader(tmpdir)
+            with mock.patch.object(downloader, "iter_user_post_pages", side_effect=pages), \
+                    mock.patch.object(downloader, "process_media_element") as process:
+                downloader.download_media("coomer.st", "user", "onlyfans", selected_post_ids=["2"])
+
+        self.assertEqual(fetched, ["1", "2"])
+        self.assertEqual(process.call_count, 1)
+
+
+class ConcurrentPagingTests(unittest.TestCase):
+    def _create_downloader(self, tmpdir):
+        with mock.patch.object(Downloader, "init_db"), \
+                mock.patch.object(Downloader, "load_download_cache"), \
+                mock.patch.object(Downloader, "load_partial_downloads"), \
+                mock.patch.object(Downloader, "load_subdomain_nodes"):
+            downloader = Downloader(tmpdir, tr=lambda text, **kwargs: text, page_concurrency=3)
+        downloader.rate_limit_interval = 0
+        return downloader
+
+    def test_pages_are_yielded_in_order_without_duplicates(self):
+        pages = {
+            0: [{"id": "1"}, {"id": "2"}],
+            50: [{"id": "2"}, {"id": "3"}],
+            100: [{"id": "4"}],
+            150: [],
+        }
+        release_first_page = threading.Event()
+        requested = []
+
+        def fetch(api_url):
+            offset = int(api_url.rsplit("o=", 1)[1])
+            requested.append(offset)
+            if offset == 0:
+                release_first_page.wait(timeout=5)
+            return pages.get(offset, [])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            downloader = self._create_downloader(tmpdir)
+            with mock.patch.object(downloader, "_fetch_posts_page", side_effect=fetch):
+                iterator = downloader.iter_user_post_pages("coomer.st", "user", "onlyfans", log_fetching=False)
+                threading.Timer(0.2, release_first_page.set).start()
+                result = [[post["id"] for post in page] for page in iterator]
+
+        self.assertEqual(result, [["1", "2"], ["3"], ["4"]])
+        self.assertIn(50, requested)
+        self.assertIn(100, requested)
+        self.assertTrue(all(offset <= 250 for offset in requested))
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+
+from downloader.rate_limiter import ConnectionLimit, HostRateLimiter, TokenBucket
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_reservations_are_spaced_by_the_rate(self):
+        bucket = TokenBucket(rate=10, burst=2)
+
+        delays = [bucket.reserve() for _ in range(4)]
+
+        self.assertEqual(delays[:2], [0.0, 0.0])
+        self.assertAlmostEqual(delays[2], 0.1, delta=0.02)
+        self.assertAlmostEqual(delays[3], 0.2, delta=0.02)
+
+    def test_zero_rate_never_waits(self):
+        bucket = TokenBucket(rate=0)
+
+        self.assertTrue(all(bucket.reserve() == 0 for _ in range(100)))
+
+    def test_acquire_returns_false_when_cancelled_while_waiting(self):
+        bucket = TokenBucket(rate=0.5, burst=1)
+        bucket.reserve()
+        cancel = threading.Event()
+        cancel.set()
+
+        self.assertFalse(bucket.acquire(cancel_event=cancel))
+
+
+class ConnectionLimitTests(unittest.TestCase):
+    def test_raising_the_limit_releases_waiters(self):
+        limit = ConnectionLimit(1)
+        limit.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            limit.acquire()
+            acquired.set()
+
+        threading.Thread(target=worker, daemon=True).start()
+        time.sleep(0.05)
+        self.assertFalse(acquired.is_set())
+
+        limit.set_limit(2)
+
+        self.assertTrue(acquired.wait(timeout=1))
+        self.assertEqual(limit.active, 2)
+
+
+class HostRateLimiterTests(unittest.TestCase):
+    def test_configured_parent_domain_covers_subdomains(self):
+        limiter = HostRateLimiter(
+            requests_per_second=1,
+            max_connections=5,
+            host_limits={"coomer.st": {"requests_per_second": 4, "burst": 8, "max_connections": 2}},
+        )
+
+        node = limiter.for_host("n3.coomer.st")
+
+        self.assertIs(node, limiter.for_host("coomer.st"))
+        self.assertEqual(node.bucket.rate, 4)
+        self.assertEqual(node.connections.limit, 2)
+        self.assertIsNot(limiter.for_host("kemono.cr"), node)
+        self.assertEqual(limiter.for_host("kemono.cr").connections.limit, 5)
+
+    def test_set_defaults_updates_existing_hosts(self):
+        limiter = HostRateLimiter(requests_per_second=1, max_connections=5)
+        host = limiter.for_host("kemono.cr")
+
+        limiter.set_defaults(requests_per_second=0, max_connections=1)
+
+        self.assertEqual(host.bucket.rate, 0)
+        self.assertEqual(host.connections.limit, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloader.downloader import Downloader
+
+
+class FakeRangeResponse:
+    def __init__(self, url, payload, start, end):
+        self.url = url
+        self.status_code = 206
+        self.headers = {"content-range": f"bytes {start}-{end}/{len(payload)}"}
+        self._body = payload[start:end + 1]
+
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self._body), 7):
+            yield self._body[index:index + 7]
+
+    def close(self):
+        pass
+
+
+class SegmentedDownloadTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.downloader = Downloader(
+            download_folder=self.temp_dir,
+            max_retries=0,
+            retry_interval=0,
+            config_dir=os.path.join(self.temp_dir, "config"),
+            segmented_downloads=True,
+            segment_count=3,
+            segment_threshold=1,
+            tr=lambda message, **kwargs: message,
+        )
+        self.downloader.log = lambda *args, **kwargs: None
+        self.downloader.min_segment_size = 1
+        self.payload = bytes(range(256)) * 4
+        self.requested_ranges = []
+
+    def tearDown(self):
+        try:
+            self.downloader.shutdown_executor()
+        finally:
+            self.downloader.db_connection.close()
+            shutil.rmtree(self.temp_dir)
+
+    def fake_safe_request(self, url, max_retries=None, headers=None):
+        start, end = headers["Range"].split("=")[1].split("-")
+        start = int(start)
+        end = int(end) if end else len(self.payload) - 1
+        self.requested_ranges.append((start, end))
+        return FakeRangeResponse(url, self.payload, start, end)
+
+    def test_segments_are_assembled_into_the_final_file(self):
+        media_url = "https://n1.coomer.st/data/ab/cd/video.mp4"
+        self.downloader.safe_request = self.fake_safe_request
+
+        self.downloader.process_media_element(media_url, "user", post_id="1")
+
+        final_path = os.path.join(self.temp_dir, "user", "videos", "video_1.mp4")
+        with open(final_path, "rb") as f:
+            self.assertEqual(f.read(), self.payload)
+        self.assertNotIn(media_url, self.downloader.partial_downloads)
+        self.assertEqual(len([r for r in self.requested_ranges if r != (0, 0)]), 3)
+
+    def test_stored_segment_progress_is_resumed(self):
+        media_url = "https://n1.coomer.st/data/ab/cd/video.mp4"
+        final_path = os.path.join(self.temp_dir, "user", "videos", "video_1.mp4")
+        tmp_path = final_path + ".tmp"
+        os.makedirs(os.path.dirname(tmp_path))
+        with open(tmp_path, "wb") as f:
+            f.write(self.payload[:100])
+            f.truncate(len(self.payload))
+        segments = [[0, 511, 100], [512, 1023, 0]]
+        self.downloader.update_partial_download(media_url, tmp_path, 100, len(self.payload), "user", "1",
+                                                segments=segments)
+        self.downloader.safe_request = self.fake_safe_request
+
+        self.downloader.process_media_element(media_url, "user", post_id="1")
+
+        with open(final_path, "rb") as f:
+            self.assertEqual(f.read(), self.payload)
+        self.assertIn((100, 511), self.requested_ranges)
+        self.assertIn((512, 1023), self.requested_ranges)
+
+
+if __name__ == "__main__":
+    unittest.main()
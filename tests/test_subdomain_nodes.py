@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from downloader.downloader import Downloader
+
+
+class DummyResponse:
+    def __init__(self, url, status_code=200):
+        self.url = url
+        self.status_code = status_code
+        self.headers = {}
+
+    def raise_for_status(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class SubdomainNodeTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.temp_dir, "config")
+        self.downloader = self._create_downloader()
+
+    def tearDown(self):
+        self.downloader.shutdown_executor()
+        self.downloader.db_connection.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _create_downloader(self, **kwargs):
+        downloader = Downloader(self.temp_dir, config_dir=self.config_dir, tr=lambda message, **kw: message,
+                                **kwargs)
+        downloader.rate_limit_interval = 0
+        return downloader
+
+    def test_probing_returns_the_first_node_that_answers(self):
+        slow_node_released = threading.Event()
+
+        def probe(test_url):
+            if "//n1." in test_url:
+                slow_node_released.wait(timeout=5)
+                return True
+            return "//n3." in test_url
+
+        with mock.patch.object(self.downloader, "_probe_node", side_effect=probe):
+            started = time.monotonic()
+            result = self.downloader._find_valid_subdomain("https://coomer.st/ab/cd/file.jpg")
+            elapsed = time.monotonic() - started
+        slow_node_released.set()
+
+        self.assertEqual(result, "https://n3.coomer.st/data/ab/cd/file.jpg")
+        self.assertLess(elapsed, 2)
+
+    def test_learned_node_is_persisted_and_used_up_front(self):
+        self.downloader._remember_node("https://n4.coomer.st/data/ab/cd/first.jpg")
+        self.downloader.db_connection.close()
+        self.downloader.shutdown_executor()
+        self.downloader = self._create_downloader()
+
+        session = mock.Mock()
+        session.get.side_effect = lambda url, **kwargs: DummyResponse(url)
+        self.downloader._session_local.session = session
+
+        response = self.downloader.safe_request("https://coomer.st/ab/ef/second.jpg")
+
+        self.assertEqual(response.url, "https://n4.coomer.st/data/ab/ef/second.jpg")
+        self.assertEqual(session.get.call_count, 1)
+
+    def test_expired_nodes_are_dropped(self):
+        self.downloader._remember_node("https://n4.coomer.st/data/ab/cd/first.jpg")
+        self.downloader.db_connection.close()
+        self.downloader.shutdown_executor()
+        self.downloader = self._create_downloader(subdomain_cache_ttl=0)
+
+        self.assertEqual(self.downloader.subdomain_cache, {})
+
+    def test_api_urls_are_never_rewritten(self):
+        self.downloader._remember_node("https://n4.coomer.st/data/api/v1/file.jpg")
+
+        self.assertIsNone(self.downloader._cached_node_url("https://coomer.st/api/v1/onlyfans/user/x"))
+
+
+if __name__ == "__main__":
+    unittest.main()